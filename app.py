@@ -11,12 +11,15 @@ Features:
 - Add new gaming session form
 """
 
+import hashlib
+import os
+import re
+import tempfile
+import time
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
-import plotly.express as px
-import gspread
-from google.oauth2.service_account import Credentials
 
 # ---------- PAGE CONFIG ----------
 st.set_page_config(page_title="Gaming History", layout="wide")
@@ -45,52 +48,235 @@ st.markdown(
 
 # ---------- GOOGLE SHEET UTILS ----------
 
-def get_gsheet_client():
-    """Authorize Google Sheets from Streamlit secrets (secure)."""
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    creds = Credentials.from_service_account_info(
-        st.secrets["google_service_account"], scopes=scope
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.readonly"
+]
+
+# Parquet copies of raw tabs survive process restarts for this many seconds.
+DISK_CACHE_TTL = 300
+
+@st.cache_resource
+def _get_credentials():
+    """Service-account credentials from Streamlit secrets (process-wide singleton)."""
+    # Google client libraries are imported lazily: only Sheets I/O needs them.
+    from google.oauth2.service_account import Credentials
+    return Credentials.from_service_account_info(
+        st.secrets["google_service_account"], scopes=SCOPES
     )
-    return gspread.authorize(creds)
+
+def get_gsheet_client():
+    """Sheets v4 service, built once per session.
+
+    Not a cache_resource: the service's httplib2 transport is not thread-safe,
+    so sessions (threads) must not share it. Only the credentials are shared.
+    """
+    if "sheets_service" not in st.session_state:
+        from googleapiclient.discovery import build
+        st.session_state["sheets_service"] = build(
+            "sheets", "v4", credentials=_get_credentials(), cache_discovery=False
+        )
+    return st.session_state["sheets_service"]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_spreadsheet_id(sheet_name):
+    """Resolve a sheet URL or title to its spreadsheet ID (memoized per name for 5 minutes)."""
+    match = re.search(r"/spreadsheets/d/([a-zA-Z0-9_-]+)", sheet_name)
+    if match:
+        return match.group(1)
+    from googleapiclient.discovery import build
+    drive = build("drive", "v3", credentials=_get_credentials(), cache_discovery=False)
+    escaped = sheet_name.replace("\\", "\\\\").replace("'", "\\'")
+    files = drive.files().list(
+        q=f"name = '{escaped}' and mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false",
+        fields="files(id)",
+        pageSize=1,
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True,
+    ).execute().get("files", [])
+    if not files:
+        raise ValueError(f"Spreadsheet '{sheet_name}' not found")
+    return files[0]["id"]
+
+def _a1_tab(tab):
+    """Quote a tab name for A1 notation."""
+    return "'" + tab.replace("'", "''") + "'"
+
+def _values_to_frame(values):
+    """Build a DataFrame from a values.get 2D array (first row is the header)."""
+    if not values:
+        return pd.DataFrame()
+    header, *rows = values
+    # Rows are ragged and may run past the header (stray unlabelled cells): trim to fit.
+    width = len(header)
+    df = pd.DataFrame([row[:width] for row in rows], columns=[str(h).strip() for h in header])
+    # Empty cells come back as "" and would pin numeric columns to object dtype.
+    return df.mask(df.eq("")).infer_objects()
+
+def _disk_cache_path(sheet_name, tab):
+    # Digest, not a sanitized name: "my sheet"/"my_sheet" or ("a_b","c")/("a","b_c") must not collide.
+    key = hashlib.sha1(repr((sheet_name, tab)).encode()).hexdigest()
+    return os.path.join(tempfile.gettempdir(), f"gametracker_{key}.parquet")
+
+def _read_disk_cache(sheet_name, tab):
+    """Parquet copy of a tab if younger than DISK_CACHE_TTL seconds, else None."""
+    path = _disk_cache_path(sheet_name, tab)
+    try:
+        if time.time() - os.path.getmtime(path) < DISK_CACHE_TTL:
+            return pd.read_parquet(path)
+    except (ImportError, OSError, ValueError):
+        pass
+    return None
+
+def _drop_disk_cache(sheet_name, tab):
+    try:
+        os.remove(_disk_cache_path(sheet_name, tab))
+    except OSError:
+        pass
+
+def _parquet_safe(df):
+    """Object columns mixing numbers and text (legacy ISO rows next to serials) -> text.
+
+    pyarrow rejects mixed-type columns; normalize_log_df parses numeric strings
+    as serials, so the round-trip keeps the same meaning.
+    """
+    df = df.copy()
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        present = df[col].notna()
+        df.loc[present, col] = df.loc[present, col].astype(str)
+    return df
+
+def _write_disk_cache(sheet_name, tab, df):
+    """Best effort: a tab Parquet still can't store is simply not persisted."""
+    path = _disk_cache_path(sheet_name, tab)
+    tmp = path + ".tmp"
+    try:
+        # Owner-only: the temp dir is shared and the sheet contents are private.
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(tmp, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            _parquet_safe(df).to_parquet(f, compression="zstd")
+        os.replace(tmp, path)
+    except (ImportError, OSError, TypeError, ValueError):
+        pass
 
 @st.cache_data(ttl=300)
-def load_from_gsheet(sheet_name, tab):
-    client = get_gsheet_client()
-    sheet = client.open(sheet_name).worksheet(tab)
-    data = sheet.get_all_records()
-    return pd.DataFrame(data)
-
-def append_to_gsheet(sheet_name, tab, row_dict):
-    """Append a row to the Google Sheet tab."""
-    client = get_gsheet_client()
-    sheet = client.open(sheet_name).worksheet(tab)
-    sheet.append_row(list(row_dict.values()))
+def load_tabs_from_gsheet(sheet_name, tabs):
+    """Read several tabs in a single values.batchGet round-trip (Parquet disk tier first)."""
+    cached = [_read_disk_cache(sheet_name, tab) for tab in tabs]
+    if all(df is not None for df in cached):
+        return cached
+    result = get_gsheet_client().spreadsheets().values().batchGet(
+        spreadsheetId=get_spreadsheet_id(sheet_name),
+        ranges=[_a1_tab(tab) for tab in tabs],
+        majorDimension="ROWS",
+        valueRenderOption="UNFORMATTED_VALUE",
+        dateTimeRenderOption="SERIAL_NUMBER",
+    ).execute()
+    frames = [_values_to_frame(r.get("values", [])) for r in result["valueRanges"]]
+    for tab, df in zip(tabs, frames):
+        _write_disk_cache(sheet_name, tab, df)
+    return frames
+
+def append_to_gsheet(sheet_name, tab, rows):
+    """Append rows to the Google Sheet tab in a single values.append call."""
+    service = get_gsheet_client()
+    service.spreadsheets().values().append(
+        spreadsheetId=get_spreadsheet_id(sheet_name),
+        range=f"{_a1_tab(tab)}!A1",
+        valueInputOption="RAW",
+        insertDataOption="INSERT_ROWS",
+        body={"values": [list(row.values()) for row in rows]},
+    ).execute()
+
+def queue_row(sheet_name, tab, row_dict):
+    """Buffer a row until the next flush_pending_rows()."""
+    st.session_state.setdefault("pending_rows", []).append((sheet_name, tab, row_dict))
+
+def flush_pending_rows():
+    """Write all buffered rows, one round-trip per target tab."""
+    pending = st.session_state.get("pending_rows", [])
+    groups = {}
+    for sheet_name, tab, row_dict in pending:
+        groups.setdefault((sheet_name, tab), []).append(row_dict)
+    for key, rows in groups.items():
+        append_to_gsheet(*key, rows)
+        # Drop each group only once written, so a failed flush can be retried.
+        st.session_state["pending_rows"] = [
+            p for p in st.session_state["pending_rows"] if p[:2] != key
+        ]
+        _drop_disk_cache(*key)
+    if groups:
+        # Every cache tier is now stale; the next load must hit Sheets.
+        load_tabs_from_gsheet.clear()
+        load_dataset.clear()
 
 # ---------- DATA NORMALIZATION ----------
 
+def _as_category(df, cols):
+    """Low-cardinality string columns -> pandas Categorical (int-coded groupby/merge keys)."""
+    for col in cols:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+def _parse_sheet_datetime(col):
+    """Sheets serial day numbers -> datetime; cells stored as text fall back to ISO8601."""
+    serial = pd.to_numeric(col, errors="coerce")
+    parsed = pd.to_datetime(serial, unit="D", origin="1899-12-30").dt.round("s")
+    text = serial.isna() & col.notna()
+    if text.any():
+        parsed = parsed.mask(text, pd.to_datetime(col.where(text), format="ISO8601", errors="coerce"))
+    return parsed
+
 def normalize_log_df(df):
     df.columns = df.columns.str.strip()
-    df["Full Start"] = pd.to_datetime(df["Full Start"], errors="coerce")
-    df["Full End"] = pd.to_datetime(df["Full End"], errors="coerce")
-    df["duration_hours"] = (
-        (df["Full End"] - df["Full Start"]).dt.total_seconds() / 3600
-    ).round(2)
-    df["month"] = pd.to_datetime(df["Full Start"]).dt.to_period("M")
-    df["weekday"] = pd.to_datetime(df["Full Start"]).dt.day_name()
+    _as_category(df, ("GAME", "SYSTEM", "SOLO OR SOCIAL", "ONLINE OR OFFLINE"))
+    start = _parse_sheet_datetime(df["Full Start"])
+    end = _parse_sheet_datetime(df["Full End"])
+    df["Full Start"] = start
+    df["Full End"] = end
+    start_ns = start.to_numpy().astype("datetime64[ns]").view("i8")
+    end_ns = end.to_numpy().astype("datetime64[ns]").view("i8")
+    nat = np.iinfo(np.int64).min
+    df["duration_hours"] = np.where(
+        (start_ns == nat) | (end_ns == nat),
+        np.nan,
+        np.round((end_ns - start_ns) * (1.0 / 3.6e12), 2),
+    )
+    df["month"] = start.dt.to_period("M")
+    df["weekday"] = start.dt.day_name()
     return df
 
 def normalize_register_df(df):
     df.columns = df.columns.str.strip()
+    genre_cols = [c for c in df.columns if c.lower().startswith("genretag")]
+    _as_category(df, ["System", "Genre", *genre_cols])
     return df
 
 def merge_data(log_df, reg_df):
+    # One register row per key: sessions never fan out, and validate can assert it.
     if "UID" in log_df.columns and "UID" in reg_df.columns:
-        return pd.merge(log_df, reg_df, on="UID", how="left")
+        reg_df = reg_df.drop_duplicates("UID")
+        return pd.merge(log_df, reg_df, on="UID", how="left", validate="many_to_one")
     else:
-        return pd.merge(log_df, reg_df, left_on="GAME", right_on="Game", how="left")
+        reg_df = reg_df.drop_duplicates("Game")
+        # Same CategoricalDtype on both keys, so the join runs on codes and GAME stays categorical.
+        games = pd.CategoricalDtype(
+            log_df["GAME"].cat.categories.union(pd.Index(reg_df["Game"].dropna().unique()), sort=False)
+        )
+        log_df = log_df.assign(GAME=log_df["GAME"].astype(games))
+        reg_df = reg_df.assign(Game=reg_df["Game"].astype(games))
+        return pd.merge(
+            log_df, reg_df, left_on="GAME", right_on="Game", how="left", validate="many_to_one"
+        )
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_dataset(sheet_name, log_tab, register_tab):
+    """Load, normalize and merge both tabs; cached on the tab names, not the frames."""
+    log_raw, reg_raw = load_tabs_from_gsheet(sheet_name, (log_tab, register_tab))
+    log_df = normalize_log_df(log_raw)
+    reg_df = normalize_register_df(reg_raw)
+    return reg_df, merge_data(log_df, reg_df)
 
 # ---------- UI HELPERS ----------
 
@@ -106,78 +292,152 @@ def show_summary_metrics(df):
     col3.metric("Unique Games", f"{unique_games}")
     col4.metric("Avg Session (hrs)", f"{avg_session:.2f}")
 
+_MILESTONE_HOURS = np.array([100, 250, 500, 1000])
+_MILESTONE_TITLES = (
+    "🎯 Casual Grinder",
+    "🔥 Hardcore Enthusiast",
+    "⚔️ Legendary Gamer",
+    "👑 God-Tier Completionist",
+)
+_BADGE_TMPL = "<span style='background:rgba(102,194,255,0.1);border:1px solid #66c2ff;border-radius:8px;padding:6px 10px;margin:5px;display:inline-block;'>%s</span>"
+
 def playtime_achievements(df):
     total_hours = df["duration_hours"].sum()
-    milestones = [
-        (100, "🎯 Casual Grinder"),
-        (250, "🔥 Hardcore Enthusiast"),
-        (500, "⚔️ Legendary Gamer"),
-        (1000, "👑 God-Tier Completionist"),
-    ]
-    badges = [
-        f"<span style='background:rgba(102,194,255,0.1);border:1px solid #66c2ff;border-radius:8px;padding:6px 10px;margin:5px;display:inline-block;'>{title}</span>"
-        for hrs, title in milestones if total_hours >= hrs
-    ]
-    if badges:
-        st.markdown("**Achievements Unlocked:** " + " ".join(badges), unsafe_allow_html=True)
+    unlocked = np.searchsorted(_MILESTONE_HOURS, total_hours, side="right")
+    if unlocked:
+        badges = " ".join(_BADGE_TMPL % title for title in _MILESTONE_TITLES[:unlocked])
+        st.markdown("**Achievements Unlocked:** " + badges, unsafe_allow_html=True)
+
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def _genre_tags(tag_frame):
+    """Sorted unique tags across the GenreTag columns."""
+    all_tags = pd.unique(tag_frame.to_numpy().ravel("K"))
+    return sorted(all_tags[pd.notna(all_tags)])
 
 def genre_filter(df_register):
     genre_cols = [c for c in df_register.columns if c.lower().startswith("genretag")]
     if not genre_cols:
         return df_register
 
-    all_tags = (
-        df_register[genre_cols].melt(value_name="tag")["tag"]
-        .dropna()
-        .unique()
-        .tolist()
-    )
-    selected_tags = st.sidebar.multiselect("🎭 Filter by genre tag", sorted(all_tags))
+    tag_frame = df_register[genre_cols]
+    selected_tags = st.multiselect("🎭 Filter by genre tag", _genre_tags(tag_frame))
     if selected_tags:
-        mask = df_register[genre_cols].isin(selected_tags).any(axis=1)
+        # OR one column at a time into a single buffer rather than materializing N x K.
+        selected = set(selected_tags)
+        mask = np.zeros(len(df_register), dtype=bool)
+        for col in genre_cols:
+            np.logical_or(mask, tag_frame[col].isin(selected).to_numpy(), out=mask)
         return df_register[mask]
     return df_register
 
-def game_card_view(df_register):
+_CARD_TMPL = (
+    "<div class='card'>"
+    "<img class='game-cover' src='{Game Image}' alt='{Game}'>"
+    "<div style='margin-top:6px;'>"
+    "<b>{Game}</b><br>"
+    "<span class='metric-small'>{System} | {Genre}</span><br>"
+    "<span class='metric-small'>🕒 {Total Time} hrs</span><br>"
+    "<span class='metric-small'>💰 ${Total Price Paid}</span>"
+    "</div></div>"
+)
+_CARD_DEFAULTS = {"Game Image": "", "System": "", "Genre": "", "Total Time": 0, "Total Price Paid": 0}
+
+def _card_value(v):
+    """Whole floats -> int: one blank cell turns an integer column into float64."""
+    return int(v) if isinstance(v, float) and v.is_integer() else v
+
+@st.cache_data(ttl=300, max_entries=32, show_spinner=False)
+def _prepare_library(df_register):
+    """Card records (column selection + defaults), computed once per register content."""
+    # Defaults are filled on the records: frame-level fillna rejects them on Categorical
+    # columns and triggers pandas' object-downcast deprecation.
+    records = df_register.reindex(columns=["Game", *_CARD_DEFAULTS]).to_dict("records")
+    return [
+        {k: _CARD_DEFAULTS.get(k, v) if pd.isna(v) else _card_value(v) for k, v in r.items()}
+        for r in records
+    ]
+
+def game_card_view(records):
     st.markdown("### 🎮 Game Library")
-    df = df_register.copy()
-    cols = st.columns(4)
-    for i, (_, row) in enumerate(df.iterrows()):
-        with cols[i % 4]:
-            st.markdown(
-                f"""
-                <div class='card'>
-                    <img class='game-cover' src='{row.get("Game Image","")}' alt='{row["Game"]}'>
-                    <div style='margin-top:6px;'>
-                        <b>{row['Game']}</b><br>
-                        <span class='metric-small'>{row.get('System','')} | {row.get('Genre','')}</span><br>
-                        <span class='metric-small'>🕒 {row.get('Total Time',0)} hrs</span><br>
-                        <span class='metric-small'>💰 ${row.get('Total Price Paid',0)}</span>
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+    # One markdown call for the whole grid instead of one delta per card.
+    cards = "".join(_CARD_TMPL.format_map(r) for r in records)
+    st.markdown(
+        f"<div style='display:grid;grid-template-columns:repeat(4,1fr);gap:12px'>{cards}</div>",
+        unsafe_allow_html=True,
+    )
+
+@st.fragment
+def _library_fragment(df_register):
+    """Genre filter + card grid; reruns on its own when the filter changes."""
+    df = genre_filter(df_register)
+    game_card_view(_prepare_library(df))
+
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def _top_n_by_sum(keys, values, n=15):
+    """Largest per-key sums, descending: factorize + bincount, no full sort of groups."""
+    codes, uniques = pd.factorize(keys)
+    valid = codes >= 0
+    weights = np.nan_to_num(values.to_numpy(dtype="float64")[valid])
+    sums = np.bincount(codes[valid], weights=weights, minlength=len(uniques))
+    top = np.argpartition(-sums, n)[:n] if len(sums) > n else np.arange(len(sums))
+    top = top[np.argsort(-sums[top], kind="stable")]
+    return pd.Series(sums[top], index=pd.Index(uniques[top], name=keys.name), name=values.name)
+
+def _lttb_indices(y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of n_out points that keep the shape of y."""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype="float64")
+    # n_out - 2 buckets over the interior points, plus the last point as a final bucket.
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(int), n)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi, nxt = edges[i], edges[i + 1], edges[i + 2]
+        avg_x, avg_y = x[hi:nxt].mean(), y[hi:nxt].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def _monthly_hours(months, hours):
+    """Hours per month, LTTB-downsampled to 500 points for long histories."""
+    month_agg = hours.groupby(months.astype(str)).sum().reset_index()
+    if len(month_agg) > 500:
+        month_agg = month_agg.iloc[_lttb_indices(month_agg[hours.name].to_numpy(), 500)]
+    return month_agg
 
 def main_charts(df):
+    import altair as alt
     with st.expander("📈 Playtime Trends", expanded=True):
         show_summary_metrics(df)
         playtime_achievements(df)
 
         st.markdown("#### Top Games by Hours")
-        top_games = df.groupby("GAME")["duration_hours"].sum().sort_values(ascending=False).head(15)
-        fig = px.bar(top_games, x=top_games.values, y=top_games.index, orientation="h", color=top_games.values)
-        fig.update_layout(yaxis_title="", xaxis_title="Hours", height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        top_games = _top_n_by_sum(df["GAME"], df["duration_hours"])
+        # st.bar_chart encodes the game axis without a sort, which orders bars alphabetically.
+        bars = alt.Chart(top_games.rename("Hours").reset_index()).mark_bar().encode(
+            x=alt.X("Hours:Q", title="Hours"),
+            y=alt.Y(f"{top_games.index.name}:N", sort="-x", title=""),
+            color=alt.Color("Hours:Q", legend=None),
+        ).properties(height=400)
+        st.altair_chart(bars, use_container_width=True)
 
         st.markdown("#### Hours by Month")
-        month_agg = df.groupby(df["month"].astype(str))["duration_hours"].sum().reset_index()
-        fig2 = px.area(month_agg, x="month", y="duration_hours")
-        fig2.update_layout(height=400)
-        st.plotly_chart(fig2, use_container_width=True)
+        month_agg = _monthly_hours(df["month"], df["duration_hours"])
+        st.area_chart(month_agg.set_index("month"), height=400)
 
 # ---------- SESSION ENTRY FORM ----------
 
+# Day zero of Google Sheets date serial numbers.
+SHEETS_EPOCH = datetime.datetime(1899, 12, 30)
+
+def _to_sheets_serial(dt):
+    return (dt - SHEETS_EPOCH).total_seconds() / 86400
+
 def new_session_form(sheet_name, log_tab):
     st.markdown("### ✏️ Log a New Gaming Session")
     with st.form("add_session"):
@@ -204,14 +464,16 @@ def new_session_form(sheet_name, log_tab):
                 "GAME": game,
                 "SOLO OR SOCIAL": solo_or_social,
                 "ONLINE OR OFFLINE": online_or_offline,
-                "Full Start": full_start.isoformat(),
-                "Full End": full_end.isoformat(),
+                # Serial day numbers, read back by normalize_log_df without string parsing.
+                "Full Start": _to_sheets_serial(full_start),
+                "Full End": _to_sheets_serial(full_end),
                 "Duration Hours": duration
             }
 
-            append_to_gsheet(sheet_name, log_tab, row)
+            queue_row(sheet_name, log_tab, row)
+            flush_pending_rows()
             st.success(f"✅ Session for {game} logged successfully!")
-            st.experimental_rerun()
+            st.rerun()
 
 # ---------- APP ----------
 
@@ -225,14 +487,10 @@ def app():
 
     if st.sidebar.button("Load data"):
         try:
-            log_df = normalize_log_df(load_from_gsheet(sheet_name, log_tab))
-            reg_df = normalize_register_df(load_from_gsheet(sheet_name, register_tab))
-            merged = merge_data(log_df, reg_df)
-            filtered_register = genre_filter(reg_df)
-
+            reg_df, merged = load_dataset(sheet_name, log_tab, register_tab)
             main_charts(merged)
             st.markdown("---")
-            game_card_view(filtered_register)
+            _library_fragment(reg_df)
             st.markdown("---")
             new_session_form(sheet_name, log_tab)
 